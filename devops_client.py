@@ -1,7 +1,12 @@
 import datetime
+import logging
 import math
 import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures import wait
 
 from azure.devops.connection import Connection
 from azure.devops.v5_1.work.models import TeamContext
@@ -9,30 +14,17 @@ from azure.devops.v5_1.work_item_tracking.models import Wiql
 from msrest.authentication import BasicAuthentication
 
 from environment import Environment
+from models import Section, Task
+from task_index import IndexNotReady, TaskIndex
+from transport import Transport
 from utils import force_format_timestamp
 
 # constants
 PARENT_TYPES = ["Product Backlog Item", "Bug"]
 
-# load env
+# load env, fetching from azure devops needs its settings
 env = Environment()
-
-
-class Task:
-    def __init__(self, id, name, owner, state, parent=None, effort=None, blocked=False):
-        self.id = id
-        self.name = name
-        self.owner = owner
-        self.state = state
-        self.parent = parent
-        self.effort = int(effort) if effort else 0
-        self.blocked = blocked
-
-    def __str__(self):
-        return f"Task {self.id}: {self.name} ({self.owner})"
-
-    def __repr__(self):
-        return self.__str__()
+env.validate_devops()
 
 
 class TaskBuilder:
@@ -42,7 +34,7 @@ class TaskBuilder:
     def from_work_item(self, work_item):
         wid = work_item.id
         name = work_item.fields["System.Title"]
-        owner = work_item.fields["System.AssignedTo"]["displayName"]
+        owner = (work_item.fields.get("System.AssignedTo") or {}).get("displayName")
         state = work_item.fields["System.State"]
         effort = work_item.fields.get("Microsoft.VSTS.Scheduling.Effort")
         tags = work_item.fields.get("System.Tags")
@@ -53,30 +45,172 @@ class TaskBuilder:
         )
 
 
-class Client:
-    def __init__(self, collaborators):
-        self._collaborators = collaborators
-
-        # Fill in with your personal access token and org URL
-        personal_access_token = env.devops_token
-        organization_url = f"https://dev.azure.com/{env.org_id}"
+class WorkItemCache:
+    """
+    Thread safe work item cache shared by all clients in the process.
+
+    Concurrent requests for the same work item wait for the first one to
+    finish instead of fetching it again, and cached items expire (and are
+    eventually dropped) after `ttl` seconds.
+    """
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._items = {}
+        self._pending = {}
+        self._pruned_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, id, fetch):
+        while True:
+            with self._lock:
+                entry = self._items.get(id)
+                if entry and time.monotonic() - entry[0] < self._ttl:
+                    return entry[1]
+
+                # someone else is already fetching this item, wait for it
+                event = self._pending.get(id)
+                if event is None:
+                    event = threading.Event()
+                    self._pending[id] = event
+                    break
+
+            event.wait()
+
+        try:
+            work_item = fetch(id)
+            self.put(work_item)
+            return work_item
+        finally:
+            with self._lock:
+                del self._pending[id]
+            event.set()
+
+    def put(self, work_item):
+        now = time.monotonic()
+        with self._lock:
+            self._items[work_item.id] = (now, work_item)
+
+            # drop expired items at most once per ttl, so the cache doesn't
+            # keep every work item ever fetched
+            if now - self._pruned_at >= self._ttl:
+                self._items = {
+                    id: entry
+                    for id, entry in self._items.items()
+                    if now - entry[0] < self._ttl
+                }
+                self._pruned_at = now
+
+
+# a single connection, transport and cache are shared by every team
+_connection = None
+_connection_lock = threading.Lock()
+work_item_cache = WorkItemCache(env.work_item_cache_ttl)
+transport = Transport(
+    pool_size=env.devops_pool_size,
+    connect_timeout=env.devops_connect_timeout,
+    read_timeout=env.devops_read_timeout,
+    compression=env.devops_compression,
+)
+
+# every fetch of every report and team runs in the same bounded pool: the
+# collaborators' tasks plus effort and scope. fetches a report stopped
+# waiting for keep running here, and the next report joins them
+fetch_executor = ThreadPoolExecutor(max_workers=env.devops_max_workers + 2)
+
+
+def get_connection():
+    global _connection
+
+    with _connection_lock:
+        if _connection is None:
+            # Fill in with your personal access token and org URL
+            personal_access_token = env.devops_token
+            organization_url = f"https://dev.azure.com/{env.org_id}"
+
+            # Create a connection to the org
+            credentials = BasicAuthentication("", personal_access_token)
+            _connection = Connection(base_url=organization_url, creds=credentials)
+
+        return _connection
 
-        # Create a connection to the org
-        credentials = BasicAuthentication("", personal_access_token)
-        connection = Connection(base_url=organization_url, creds=credentials)
 
-        # clients and controllers
-        self._wit_client = connection.clients.get_work_item_tracking_client()
+class Client:
+    def __init__(self, team):
+        self._team = team
+        self._collaborators = team.collaborators
+
+        # clients and controllers, shared between teams through the connection
+        connection = get_connection()
+        with _connection_lock:
+            self._wit_client = connection.clients.get_work_item_tracking_client()
+            self._work_client = connection.clients.get_work_client()
+            transport.configure(self._wit_client)
+            transport.configure(self._work_client)
         self._task_builder = TaskBuilder()
-        self._work_client = connection.clients.get_work_client()
+
+        # fetches still running, by section or collaborator
+        self._fetches = {}
+        self._fetches_lock = threading.Lock()
+
+        # last successfully fetched report sections, used as fallback.
+        # tasks are kept per collaborator, since they are fetched that way
+        self._last_known = {}
+        self._last_known_tasks = {}
+
+        # index of the current iteration, refreshed in the background from
+        # the first lookup on
+        self._index = TaskIndex(
+            self._get_iteration_ids,
+            self._get_work_items,
+            self._task_builder,
+            env.index_refresh_interval,
+        )
 
     def _get_work_item(self, id):
-        return self._wit_client.get_work_item(id)
+        return work_item_cache.get(id, self._wit_client.get_work_item)
+
+    def _get_work_items(self, ids):
+        # fetch in batches, keeping the shared cache up to date
+        work_items = []
+        for i in range(0, len(ids), 200):
+            batch = self._wit_client.get_work_items(
+                ids=ids[i:i + 200], error_policy="omit"
+            )
+            for work_item in batch:
+                if work_item is not None:
+                    work_item_cache.put(work_item)
+                    work_items.append(work_item)
+
+        return work_items
 
-    def _query_by_wiql(self, query, top=100):
+    def _query_by_wiql(self, query, top=100, time_precision=None):
         wiql = Wiql(query=query)
 
-        return self._wit_client.query_by_wiql(wiql, top=top)
+        return self._wit_client.query_by_wiql(
+            wiql, top=top, time_precision=time_precision
+        )
+
+    def _get_iteration_ids(self, changed_since=None):
+        project = self._team.project_id
+        team = self._team.team_id
+        changed = ""
+        if changed_since:
+            # leave some room for clock differences with the server
+            since = changed_since - datetime.timedelta(minutes=1)
+            changed = f"AND [System.ChangedDate] > '{since:%Y-%m-%dT%H:%M:%SZ}'"
+        query = f"""
+            SELECT [System.Id]
+            FROM WorkItems
+            WHERE [System.WorkItemType] IN ('Task', 'Product Backlog Item', 'Bug')
+                AND [System.IterationPath] UNDER
+                    @currentIteration('[{project}]\\{team}')
+                {changed}"""  # noqa
+        wiql_results = self._query_by_wiql(
+            query, top=20000, time_precision=True
+        ).work_items
+
+        return [int(res.id) for res in wiql_results or []]
 
     def _get_parent_by_task_id(self, task_id):
         query = f"""
@@ -109,8 +243,8 @@ class Client:
 
     def _get_tasks_by_user(self, username):
         yesterday = datetime.date.today() - datetime.timedelta(days=1)
-        project = env.project_id
-        team = env.team_id
+        project = self._team.project_id
+        team = self._team.team_id
         query = f"""
             SELECT [System.Id],
                 [System.Title],
@@ -150,7 +284,9 @@ class Client:
         return (username, results)
 
     def _get_current_sprint(self):
-        team_context = TeamContext(project=env.project_id, team=env.team_id)
+        team_context = TeamContext(
+            project=self._team.project_id, team=self._team.team_id
+        )
         iteration = self._work_client.get_team_iterations(
             team_context, timeframe="current"
         )[0]
@@ -165,7 +301,7 @@ class Client:
         # our SCRUMBAN scope is defined by all of the prioritized
         # work items, which all receive a tag with the name of our
         # current release
-        qid = env.sprint_items_query_id
+        qid = self._team.sprint_items_query_id
         done_count = 0
         not_done_count = 0
         remaning_effort = 0
@@ -249,46 +385,175 @@ class Client:
 
         return results
 
-    def _get_tasks(self):
-        # TODO: this is a hack to get around different thread contexts.
-        # it kinda sucks, but it works for now.
-        task_list = []
+    def _submit(self, key, fn, *args):
+        # join a fetch of the same thing that is still running, an earlier
+        # report may have stopped waiting for it
+        with self._fetches_lock:
+            future = self._fetches.get(key)
+            if future is None or future.done():
+                future = fetch_executor.submit(fn, *args)
+                self._fetches[key] = future
+
+            return future
+
+    def _get_tasks(self, timeout=None):
+        # fetch collaborators in the shared pool, collaborators that fail or
+        # don't make it before the timeout are left as None
+        futures = {
+            self._submit(("tasks", collaborator), self._get_tasks_by_user,
+                         collaborator): collaborator
+            for collaborator in self._collaborators.keys()
+        }
+        done, not_done = wait(futures, timeout=timeout)
+
+        # merge all results into a single sorted task map
+        task_map = {}
+        for future, collaborator in futures.items():
+            task_map[collaborator] = None
+            if future in not_done:
+                logging.warning(f"Timed out fetching tasks for {collaborator}.")
+                continue
 
-        def _get_tasks_by_user(username, task_list):
             try:
-                tasks = self._get_tasks_by_user(username)
-                task_list.append(tasks)
+                _, tasks = future.result()
             except Exception:
-                traceback.print_exc()
+                logging.error(traceback.format_exc())
+                continue
+
+            task_map[collaborator] = sorted(tasks, key=lambda task: task.id)
+
+        return task_map
+
+    def get_tasks(self, timeout=None):
+        return self._get_tasks(timeout=timeout)
+
+    def _fetch_section(self, name, fetch, timeout):
+        try:
+            section = Section(name, value=fetch(timeout))
+            self._last_known[name] = section
+
+            return section
+        except FuturesTimeoutError:
+            error = "timed out"
+            logging.warning(f"Timed out fetching {name} section.")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logging.error(traceback.format_exc())
+
+        # fall back to the last value we know of, if any
+        last_known = self._last_known.get(name)
+        if last_known is None:
+            return Section(name, error=error)
+
+        return Section(
+            name,
+            value=last_known.value,
+            fetched_at=last_known.fetched_at,
+            stale=True,
+            error=error,
+        )
 
-        # create threads for each collaborator
-        threads = []
-        for collaborator in self._collaborators.keys():
-            t = threading.Thread(
-                target=_get_tasks_by_user, args=(collaborator, task_list)
+    def _fetch_tasks_section(self, timeout):
+        try:
+            task_map = self.get_tasks(timeout=timeout)
+        except Exception:
+            logging.error(traceback.format_exc())
+            task_map = {collaborator: None for collaborator in self._collaborators}
+
+        # keep fresh tasks per collaborator, missing ones never overwrite them
+        now = datetime.datetime.now()
+        for collaborator, tasks in task_map.items():
+            if tasks is not None:
+                self._last_known_tasks[collaborator] = (now, tasks)
+
+        missing = sorted(
+            collaborator for collaborator, tasks in task_map.items() if tasks is None
+        )
+        if not missing:
+            return Section("tasks", value=task_map, fetched_at=now)
+
+        # fall back to the last tasks we know of for each missing collaborator
+        fetched_at = now
+        for collaborator in missing:
+            if collaborator in self._last_known_tasks:
+                last_fetched_at, tasks = self._last_known_tasks[collaborator]
+                task_map[collaborator] = tasks
+                fetched_at = min(fetched_at, last_fetched_at)
+
+        return Section(
+            "tasks",
+            value=task_map,
+            fetched_at=fetched_at,
+            stale=fetched_at < now,
+            error=f"no fresh tasks for {', '.join(missing)}",
+        )
+
+    def get_report(self):
+        """
+        Fetch effort, scope and tasks concurrently, giving each section its
+        own time budget within the overall report deadline.
+
+        Sections that miss their budget or fail are replaced by their last
+        known value, marked as stale, or left unavailable.
+        """
+        timeouts = {
+            name: min(budget, env.report_deadline)
+            for name, budget in (
+                ("effort", env.effort_budget),
+                ("scope", env.scope_budget),
+                ("tasks", env.tasks_budget),
             )
-            threads.append(t)
-            t.start()
+        }
+        start = time.monotonic()
 
-        # wait for all threads to finish
-        for t in threads:
-            t.join()
+        # effort and scope go to the background, tasks already fan out
+        effort = self._submit("effort", self.get_total_effort)
+        scope = self._submit("scope", self.get_current_scope)
 
-        # merge all results into a single sorted task map
-        task_map = {}
-        for collaborator, tasks in task_list:
-            tasks = sorted(tasks, key=lambda task: task.id)
-            task_map[collaborator] = tasks
+        def remaining(name):
+            return max(timeouts[name] - (time.monotonic() - start), 0)
 
-        return task_map
+        report = {
+            "tasks": self._fetch_tasks_section(remaining("tasks")),
+            "effort": self._fetch_section(
+                "effort", lambda timeout: effort.result(timeout=timeout),
+                remaining("effort"),
+            ),
+            "scope": self._fetch_section(
+                "scope", lambda timeout: scope.result(timeout=timeout),
+                remaining("scope"),
+            ),
+        }
+        logging.info(f"Azure Devops transport: {transport.stats}")
+
+        return report
+
+    def _get_index(self):
+        # the index only runs once lookups are used, and they never wait for it
+        self._index.start()
+        if not self._index.wait(timeout=0):
+            raise IndexNotReady("Task index is warming up, try again shortly.")
+
+        return self._index
+
+    def get_user_tasks(self, name):
+        index = self._get_index()
+        owner = index.find_owner(name)
+        if owner is None:
+            return None, []
+
+        return owner, index.get_owner_tasks(owner)
+
+    def get_item(self, id):
+        return self._get_index().get_item(id)
 
-    def get_tasks(self):
-        return self._get_tasks()
+    def get_blocked(self):
+        return self._get_index().get_blocked()
 
     def get_total_effort(self):
         # this is hardcoded since it's very project specific for us.
         # the current epic is defined under the query id
-        qid = env.epic_items_query_id
+        qid = self._team.epic_items_query_id
         results = self._wit_client.query_by_id(qid).work_item_relations
         work_items = [self._get_work_item(int(res.target.id)) for res in results]
 
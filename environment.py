@@ -34,17 +34,65 @@ class Environment(metaclass=Singleton):
             format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
             level=logging.INFO)
 
-        # set env vars
-        self.devops_token = self._validate('DEVOPS_TOKEN')
-        self.sprint_items_query_id = self._validate('SPRINT_ITEMS_QUERY_ID')
-        self.epic_items_query_id = self._validate('EPIC_ITEMS_QUERY_ID')
+        # set env vars. azure devops ones are only checked by the processes
+        # that fetch from it, see `validate_devops`
+        self.devops_token = os.getenv('DEVOPS_TOKEN')
+        self.teams_file = os.getenv('TEAMS_FILE', 'teams.json')
+        self.collaborators_file = os.getenv('COLLABORATORS_FILE',
+                                            'collaborators.json')
         self.telegram_token = self._validate('TELEGRAM_TOKEN')
         self.discord_bot_token = self._validate('DISCORD_BOT_TOKEN')
-        self.org_id = self._validate('ORGANIZATION_ID')
-        self.project_id = self._validate('PROJECT_ID')
-        self.team_id = self._validate('TEAM_ID')
+        self.org_id = os.getenv('ORGANIZATION_ID')
+        self.project_id = os.getenv('PROJECT_ID')
+
+        # team specific vars are only used when there is no teams file,
+        # otherwise each team in it brings its own
+        if os.path.exists(self.teams_file):
+            self.team_id = None
+            self.sprint_items_query_id = None
+            self.epic_items_query_id = None
+        else:
+            self.team_id = os.getenv('TEAM_ID')
+            self.sprint_items_query_id = os.getenv('SPRINT_ITEMS_QUERY_ID')
+            self.epic_items_query_id = os.getenv('EPIC_ITEMS_QUERY_ID')
+
         self.increased_scope_threshold = os.getenv('INCREASED_SCOPE_THRESHOLD',
                                                    1)
         self.work_days_per_week = os.getenv('WORK_DAYS_PER_WEEK', 4)
         self.telegram_allowed_chat_ids = os.getenv('TELEGRAM_ALLOWED_CHAT_IDS',
                                                    ',').split(',')
+        self.work_item_cache_ttl = int(os.getenv('WORK_ITEM_CACHE_TTL', 60))
+        self.scheduler_workers = int(os.getenv('SCHEDULER_WORKERS', 2))
+        self.scheduler_max_queue = int(os.getenv('SCHEDULER_MAX_QUEUE', 10))
+        self.coalesce_window = int(os.getenv('COALESCE_WINDOW', 30))
+        self.report_deadline = float(os.getenv('REPORT_DEADLINE', 60))
+        self.effort_budget = float(os.getenv('EFFORT_BUDGET', 30))
+        self.scope_budget = float(os.getenv('SCOPE_BUDGET', 30))
+        self.tasks_budget = float(os.getenv('TASKS_BUDGET', 45))
+        self.devops_max_workers = int(os.getenv('DEVOPS_MAX_WORKERS', 8))
+        # by default, enough connections for every scheduler worker to fetch
+        # tasks, effort and scope at the same time
+        self.devops_pool_size = int(
+            os.getenv('DEVOPS_POOL_SIZE',
+                      self.scheduler_workers * (self.devops_max_workers + 2)))
+        self.devops_connect_timeout = float(
+            os.getenv('DEVOPS_CONNECT_TIMEOUT', 5))
+        self.devops_read_timeout = float(os.getenv('DEVOPS_READ_TIMEOUT', 30))
+        self.devops_compression = os.getenv('DEVOPS_COMPRESSION',
+                                            'true').lower() == 'true'
+        self.fetcher_socket = os.getenv('FETCHER_SOCKET')
+        self.index_refresh_interval = float(
+            os.getenv('INDEX_REFRESH_INTERVAL', 60))
+        self.fetcher_timeout_margin = float(
+            os.getenv('FETCHER_TIMEOUT_MARGIN', 10))
+
+    def validate_devops(self):
+        # bots that go through a fetcher never talk to azure devops, only
+        # the processes that do need its settings
+        self._validate('DEVOPS_TOKEN')
+        self._validate('ORGANIZATION_ID')
+        self._validate('PROJECT_ID')
+        if not os.path.exists(self.teams_file):
+            self._validate('TEAM_ID')
+            self._validate('SPRINT_ITEMS_QUERY_ID')
+            self._validate('EPIC_ITEMS_QUERY_ID')
@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import traceback
+import zlib
+from concurrent.futures import Future
+
+from environment import Environment
+from models import Section, Task
+from task_index import IndexNotReady
+
+# load env
+env = Environment()
+
+# frames are a 4 byte big endian length followed by zlib compressed json
+HEADER = struct.Struct(">I")
+
+
+def _send_frame(sock, data):
+    payload = zlib.compress(json.dumps(data, default=str).encode("utf-8"))
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Fetcher connection closed.")
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _recv_frame(sock):
+    (size,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    payload = _recv_exactly(sock, size)
+
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def _encode_tasks(task_map):
+    return {
+        owner: [task.to_dict() for task in tasks] if tasks is not None else None
+        for owner, tasks in task_map.items()
+    }
+
+
+def _decode_tasks(task_map):
+    return {
+        owner: [Task.from_dict(task) for task in tasks] if tasks is not None else None
+        for owner, tasks in task_map.items()
+    }
+
+
+def _encode_report(report):
+    sections = {}
+    for name, section in report.items():
+        data = section.to_dict()
+        if name == "tasks" and section.value is not None:
+            data["value"] = _encode_tasks(section.value)
+        sections[name] = data
+
+    return sections
+
+
+def _decode_report(sections):
+    report = {}
+    for name, data in sections.items():
+        section = Section.from_dict(data)
+        if name == "tasks" and section.value is not None:
+            section.value = _decode_tasks(section.value)
+        report[name] = section
+
+    return report
+
+
+class _FetcherHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            request = _recv_frame(self.request)
+            response = self.server.dispatch(request)
+        except ConnectionError:
+            return
+        except IndexNotReady as e:
+            response = {"error": str(e), "not_ready": True}
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            response = {"error": f"{type(e).__name__}: {e}"}
+
+        _send_frame(self.request, response)
+
+
+class FetcherServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves reports from a single set of team clients over a local unix
+    socket, so every bot shares the same connection, caches and fetches.
+
+    Concurrent report requests for the same team share a single fetch.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, registry):
+        self._registry = registry
+        self._reports = {}
+        self._lock = threading.Lock()
+
+        # remove a socket left behind by a previous run
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _FetcherHandler)
+
+    def _get_report(self, team_name):
+        client = self._registry.get_team_client(team_name)
+        if client is None:
+            raise Exception(f"Unknown team {team_name}.")
+
+        # join a fetch already running for this team, if any
+        with self._lock:
+            future = self._reports.get(team_name)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._reports[team_name] = future
+
+        if owner:
+            try:
+                future.set_result(client.get_report())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._reports[team_name]
+
+        return future.result()
+
+    def dispatch(self, request):
+        op = request.get("op")
+        if op == "team":
+            chat_id = request["chat_id"]
+            team = self._registry.get_team(chat_id)
+            return {
+                "team": team.name if team else None,
+                "has_chat": self._registry.has_chat(chat_id),
+            }
+        elif op == "report":
+            report = self._get_report(request["team"])
+            return {"report": _encode_report(report)}
+
+        # lookups are answered straight from the team's task index
+        client = self._registry.get_team_client(request.get("team"))
+        if client is None:
+            raise Exception(f"Unknown team {request.get('team')}.")
+
+        if op == "tasks":
+            owner, tasks = client.get_user_tasks(request["name"])
+            return {"owner": owner, "tasks": [task.to_dict() for task in tasks]}
+        elif op == "item":
+            item, children = client.get_item(request["id"])
+            return {
+                "item": item.to_dict() if item else None,
+                "children": [child.to_dict() for child in children],
+            }
+        elif op == "blocked":
+            items = client.get_blocked()
+            return {"items": [item.to_dict() for item in items]}
+
+        raise Exception(f"Unknown fetcher operation {op}.")
+
+
+def _request(socket_path, request, timeout):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        _send_frame(sock, request)
+        response = _recv_frame(sock)
+
+    if response.get("not_ready"):
+        raise IndexNotReady(response["error"])
+    if "error" in response:
+        raise Exception(f"Fetcher error: {response['error']}")
+
+    return response
+
+
+class RemoteClient:
+    """
+    Thin client with the same interface as `devops_client.Client`, backed by
+    a fetcher daemon instead of its own Azure Devops connection.
+    """
+
+    def __init__(self, socket_path, team_name):
+        self._socket_path = socket_path
+        self._team_name = team_name
+
+    def _request(self, request, timeout=None):
+        # lookups are answered from the index right away, reports get the
+        # whole report deadline, and then some
+        if timeout is None:
+            timeout = env.fetcher_timeout_margin
+        return _request(self._socket_path, request, timeout)
+
+    def get_report(self):
+        timeout = env.report_deadline + env.fetcher_timeout_margin
+        response = self._request({"op": "report", "team": self._team_name}, timeout)
+        return _decode_report(response["report"])
+
+    def get_user_tasks(self, name):
+        response = self._request(
+            {"op": "tasks", "team": self._team_name, "name": name}
+        )
+        tasks = [Task.from_dict(task) for task in response["tasks"]]
+
+        return response["owner"], tasks
+
+    def get_item(self, id):
+        response = self._request({"op": "item", "team": self._team_name, "id": id})
+        item = response["item"]
+        children = [Task.from_dict(child) for child in response["children"]]
+
+        return Task.from_dict(item) if item else None, children
+
+    def get_blocked(self):
+        response = self._request({"op": "blocked", "team": self._team_name})
+        return [Task.from_dict(item) for item in response["items"]]
+
+
+class RemoteRegistry:
+    """
+    Same interface as `teams.TeamRegistry`, resolving chats to teams through
+    the fetcher daemon.
+    """
+
+    def __init__(self, socket_path):
+        self._socket_path = socket_path
+
+    def _get_team(self, chat_id):
+        request = {"op": "team", "chat_id": str(chat_id)}
+        return _request(self._socket_path, request, env.fetcher_timeout_margin)
+
+    def resolve(self, chat_id):
+        # a single round trip for both the allow check and the team
+        response = self._get_team(chat_id)
+        if response["team"] is None:
+            return response["has_chat"], None
+
+        return response["has_chat"], RemoteClient(self._socket_path, response["team"])
+
+    def has_chat(self, chat_id):
+        return self._get_team(chat_id)["has_chat"]
+
+    def get_client(self, chat_id):
+        return self.resolve(chat_id)[1]
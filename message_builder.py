@@ -15,38 +15,115 @@ def build_waiting():
     return working_text
 
 
+def build_queued(position):
+    queued_text = f"Busy, daily request queued at position {position}..."
+
+    return queued_text
+
+
+def build_busy():
+    busy_text = "Too many requests right now, please try again in a moment."
+
+    return busy_text
+
+
+def build_coalesced(finished=False):
+    if finished:
+        coalesced_text = "A daily was just sent, see the message above."
+    else:
+        coalesced_text = "A daily is already on its way, see the message above."
+
+    return coalesced_text
+
+
+def build_unavailable():
+    unavailable_text = (
+        "Could not reach the Televops fetcher, please try again in a moment."
+    )
+
+    return unavailable_text
+
+
+def build_warming():
+    warming_text = "The task index is warming up, please try again shortly."
+
+    return warming_text
+
+
 def build_scope(scope, effort):
-    # send scope and effort info
-    completed = "{:.2f}".format(100 * scope["completed"])
-    sprint_percentage = "{:.2f}".format(100 *
-                                        effort["sprint_percentage_effort"])
-    epic_percentage = "{:.2f}".format(100 * effort["epic_percentage_effort"])
-    capacity_percentage = "{:.2f}".format(100 *
-                                          effort["epic_velocity_percentage"])
-    blocked_effort = effort["blocked_effort"]
-
-    # present body
+    # present body, sections that could not be fetched are left out
     body = "Current iteration:\n"
     body += "```\n"
-    body += f"├── Sprint Stories/Bugs: {scope['done']}/{scope['total']} ({completed}%)\n"  # noqa
-    body += "├── Effort\n"
-    body += f"│   ├── Sprint Progress: {effort['sprint_completed_effort']}/{effort['sprint_total_effort']} work days completed ({sprint_percentage}%)\n"  # noqa
-    body += f"│   ├── Epic Progress: {effort['epic_completed_effort']}/{effort['epic_total_effort']} work days completed ({epic_percentage}%)\n"  # noqa
-    body += f"│   ├── Epic Velocity: {effort['epic_remaining_effort']}/{effort['remaining_work_days']} work days remaining ({capacity_percentage}%)\n"  # noqa
-    body += f"│   ├── Blocked: {blocked_effort} work days\n"
-    body += f"│   ├── Work Days Per Week: {effort['work_days_per_week']}\n"
-    body += f"│   ├── Developers: {effort['num_developers']}\n"
-    body += f"│   ├── Sprint Capacity: {effort['sprint_capacity']}\n"
-    body += f"├── Increased Scope: {scope['increased_scope']}\n"
-    body += f"├── Projected Date: {scope['projected_date']}/{scope['release_date']}\n"  # noqa
+    if scope:
+        completed = "{:.2f}".format(100 * scope["completed"])
+        body += f"├── Sprint Stories/Bugs: {scope['done']}/{scope['total']} ({completed}%)\n"  # noqa
+    else:
+        body += "├── Sprint Stories/Bugs: unavailable\n"
+
+    if effort:
+        # send scope and effort info
+        sprint_percentage = "{:.2f}".format(100 *
+                                            effort["sprint_percentage_effort"])
+        epic_percentage = "{:.2f}".format(100 *
+                                          effort["epic_percentage_effort"])
+        capacity_percentage = "{:.2f}".format(
+            100 * effort["epic_velocity_percentage"])
+        blocked_effort = effort["blocked_effort"]
+
+        body += "├── Effort\n"
+        body += f"│   ├── Sprint Progress: {effort['sprint_completed_effort']}/{effort['sprint_total_effort']} work days completed ({sprint_percentage}%)\n"  # noqa
+        body += f"│   ├── Epic Progress: {effort['epic_completed_effort']}/{effort['epic_total_effort']} work days completed ({epic_percentage}%)\n"  # noqa
+        body += f"│   ├── Epic Velocity: {effort['epic_remaining_effort']}/{effort['remaining_work_days']} work days remaining ({capacity_percentage}%)\n"  # noqa
+        body += f"│   ├── Blocked: {blocked_effort} work days\n"
+        body += f"│   ├── Work Days Per Week: {effort['work_days_per_week']}\n"
+        body += f"│   ├── Developers: {effort['num_developers']}\n"
+        body += f"│   ├── Sprint Capacity: {effort['sprint_capacity']}\n"
+    else:
+        body += "├── Effort: unavailable\n"
+
+    if scope:
+        body += f"├── Increased Scope: {scope['increased_scope']}\n"
+        body += f"├── Projected Date: {scope['projected_date']}/{scope['release_date']}\n"  # noqa
+    body += "```" + "\n"
+
+    return body
+
+
+def build_stale(report, escape=None):
+    # list the sections that missed their deadline or failed. errors are raw
+    # exception messages, `escape` makes them safe for the chat's markup
+    sections = [section for section in report.values() if section.error]
+    if not sections:
+        return ""
+
+    body = "Some sections could not be fetched:\n"
+    body += "```\n"
+    for section in sections:
+        name = section.name.capitalize()
+        error = escape(section.error) if escape else section.error
+        if section.stale:
+            fetched_at = section.fetched_at.strftime("%Y-%m-%d %H:%M:%S")
+            body += f"├── {name}: stale, last known value from {fetched_at} ({error})\n"  # noqa
+        else:
+            body += f"├── {name}: unavailable ({error})\n"
     body += "```" + "\n"
 
     return body
 
 
 def build_tasks(fetched_tasks):
+    if fetched_tasks is None:
+        body = "Tasks are unavailable right now.\n"
+        body += "Please, type in your current status. Don't forget to include what you're doing, what you plan to do, and if you have any impediments!"  # noqa
+
+        return body
+
     task_map = {}
     for owner, tasks in fetched_tasks.items():
+        if tasks is None:
+            # tasks for this owner could not be fetched
+            task_map[owner] = None
+            continue
         if owner not in task_map:
             task_map[owner] = {}
         for task in tasks:
@@ -58,11 +135,12 @@ def build_tasks(fetched_tasks):
 
     # sort parents by id
     for owner, work_items in task_map.items():
-        task_map[owner] = dict(sorted(work_items.items()))
+        if work_items is not None:
+            task_map[owner] = dict(sorted(work_items.items()))
 
     # sort tasks by id
     for owner, work_items in task_map.items():
-        for parent, tasks in work_items.items():
+        for parent, tasks in (work_items or {}).items():
             task_map[owner][parent] = sorted(tasks, key=lambda x: x.id)
 
     # sort owners by name
@@ -73,7 +151,9 @@ def build_tasks(fetched_tasks):
     for owner, work_items in task_map.items():
         body += owner + " is working on:\n"
         body += "```\n"
-        if work_items:
+        if work_items is None:
+            body += "Tasks unavailable.\n"
+        elif work_items:
             for parent_id, tasks in work_items.items():
                 parent = tasks[0].parent  # all tasks have the same parent
                 parent_effort = f'- ({parent.effort} days)' if parent.effort else ''  # noqa
@@ -91,6 +171,79 @@ def build_tasks(fetched_tasks):
     return body
 
 
+def _build_parent(parent):
+    if parent is None:
+        return "├── No parent\n"
+
+    parent_effort = f'- ({parent.effort} days)' if parent.effort else ''
+    blocked = '[BLOCKED] ' if parent.blocked else ''
+
+    return f"├── {blocked}{parent.id}. {parent.name} {parent_effort}\n"
+
+
+def build_user_tasks(owner, tasks):
+    if owner is None:
+        return "Could not find this collaborator in the current iteration.\n"
+
+    # group tasks by parent, tasks without a parent go last
+    parents = {}
+    for task in tasks:
+        parent_id = task.parent.id if task.parent else None
+        parents.setdefault(parent_id, []).append(task)
+    parent_ids = sorted(parents, key=lambda x: (x is None, x or 0))
+
+    body = owner + " is working on:\n"
+    body += "```\n"
+    if tasks:
+        for parent_id in parent_ids:
+            body += _build_parent(parents[parent_id][0].parent)
+            for task in parents[parent_id]:
+                body += f"│   ├── {task.id}. {task.name} - ({task.state})\n"
+    else:
+        body += "No open tasks.\n"
+    body += "```" + "\n"
+
+    return body
+
+
+def build_item(item, children):
+    if item is None:
+        return "Could not find this work item in the current iteration.\n"
+
+    blocked = '[BLOCKED] ' if item.blocked else ''
+    effort = f'- ({item.effort} days)' if item.effort else ''
+
+    body = "Work item:\n"
+    body += "```\n"
+    body += f"{item.id}. {item.name}\n"
+    body += f"├── State: {blocked}{item.state} {effort}\n"
+    body += f"├── Owner: {item.owner or 'Unassigned'}\n"
+    if item.parent:
+        body += f"├── Parent: {item.parent.id}. {item.parent.name}\n"
+    if children:
+        body += "├── Children\n"
+        for child in children:
+            body += f"│   ├── {child.id}. {child.name} - ({child.state}, {child.owner or 'Unassigned'})\n"  # noqa
+    body += "```" + "\n"
+
+    return body
+
+
+def build_blocked(items):
+    body = "Blocked work items:\n"
+    body += "```\n"
+    if items:
+        for item in items:
+            effort = f'- ({item.effort} days)' if item.effort else ''
+            body += f"├── {item.id}. {item.name} {effort}\n"
+            body += f"│   ├── {item.state}, {item.owner or 'Unassigned'}\n"
+    else:
+        body += "Nothing is blocked.\n"
+    body += "```" + "\n"
+
+    return body
+
+
 def build_error(traceback):
     body = "Could not fetch content from Azure Devops. Error trace: \n"
     body += "```" + "\n"
@@ -0,0 +1,81 @@
+import datetime
+
+
+class Task:
+    def __init__(self, id, name, owner, state, parent=None, effort=None, blocked=False):
+        self.id = id
+        self.name = name
+        self.owner = owner
+        self.state = state
+        self.parent = parent
+        self.effort = int(effort) if effort else 0
+        self.blocked = blocked
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "owner": self.owner,
+            "state": self.state,
+            "parent": self.parent.to_dict() if self.parent else None,
+            "effort": self.effort,
+            "blocked": bool(self.blocked),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        parent = data.get("parent")
+
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            owner=data["owner"],
+            state=data["state"],
+            parent=cls.from_dict(parent) if parent else None,
+            effort=data.get("effort"),
+            blocked=data.get("blocked", False),
+        )
+
+    def __str__(self):
+        return f"Task {self.id}: {self.name} ({self.owner})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Section:
+    def __init__(self, name, value=None, fetched_at=None, stale=False, error=None):
+        self.name = name
+        self.value = value
+        self.fetched_at = fetched_at or datetime.datetime.now()
+        self.stale = stale
+        self.error = error
+
+    @property
+    def available(self):
+        return self.value is not None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "value": self.value,
+            "fetched_at": self.fetched_at.isoformat(),
+            "stale": self.stale,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            name=data["name"],
+            value=data["value"],
+            fetched_at=datetime.datetime.fromisoformat(data["fetched_at"]),
+            stale=data["stale"],
+            error=data["error"],
+        )
+
+    def __str__(self):
+        return f"Section {self.name} (stale={self.stale}, error={self.error})"
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,142 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future
+
+
+class Ticket:
+    def __init__(self, future=None, position=0, coalesced=False, rejected=False):
+        self.future = future
+        self.position = position
+        self.coalesced = coalesced
+        self.rejected = rejected
+
+    @property
+    def finished(self):
+        # coalesced into a command that already finished, not one still running
+        return self.future is not None and self.future.done()
+
+    def __str__(self):
+        return (
+            f"Ticket (position={self.position}, coalesced={self.coalesced}, "
+            f"rejected={self.rejected})"
+        )
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class CommandScheduler:
+    """
+    Runs bot commands in a fixed pool of worker threads.
+
+    Repeated commands from the same chat are coalesced into the one already
+    queued or running (or finished less than `coalesce_window` seconds ago),
+    at most `max_queue` commands wait for a worker, and queued commands are
+    picked round robin across chats so a noisy chat can't starve the others.
+    """
+
+    def __init__(self, workers, max_queue, coalesce_window):
+        self._workers = workers
+        self._max_queue = max_queue
+        self._coalesce_window = coalesce_window
+
+        # chat id -> queued jobs, ordered by whose turn it is
+        self._queues = collections.OrderedDict()
+        # (chat id, command) -> (future, finished at)
+        self._jobs = {}
+        self._pending = 0
+        self._running = 0
+        self._condition = threading.Condition()
+
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, (future, finished_at) in list(self._jobs.items()):
+            if finished_at is not None and now - finished_at >= self._coalesce_window:
+                del self._jobs[key]
+
+    def _position(self, chat_id):
+        # count the jobs picked before a new one from this chat, going
+        # through the chats in turn and taking one job from each at a time.
+        # chats without queued jobs get their turn after everyone else
+        queue = self._queues.get(chat_id)
+        turn = len(queue) if queue else 0
+        ahead = turn
+        before = True
+        for other_id, other_queue in self._queues.items():
+            if other_id == chat_id:
+                before = False
+            elif before:
+                ahead += min(len(other_queue), turn + 1)
+            else:
+                ahead += min(len(other_queue), turn)
+
+        # the job starts right away if there is an idle worker left for it
+        idle = self._workers - self._running
+        return max(ahead - idle + 1, 0)
+
+    def _finish(self, key, future):
+        with self._condition:
+            if self._jobs.get(key, (None,))[0] is not future:
+                return
+
+            if future.exception() is not None:
+                # failed commands must not swallow retries
+                del self._jobs[key]
+            else:
+                self._jobs[key] = (future, time.monotonic())
+
+    def submit(self, chat_id, command, fn, *args):
+        chat_id = str(chat_id)
+        key = (chat_id, command)
+
+        with self._condition:
+            self._prune()
+
+            # same command from the same chat, answer it only once
+            job = self._jobs.get(key)
+            if job is not None:
+                return Ticket(future=job[0], coalesced=True)
+
+            if self._pending >= self._max_queue:
+                return Ticket(rejected=True)
+
+            future = Future()
+            position = self._position(chat_id)
+            self._queues.setdefault(chat_id, collections.deque()).append(
+                (future, fn, args)
+            )
+            self._jobs[key] = (future, None)
+            self._pending += 1
+            self._condition.notify()
+
+        future.add_done_callback(lambda f: self._finish(key, f))
+
+        return Ticket(future=future, position=position)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queues:
+                    self._condition.wait()
+
+                # take one job from the first chat and send it to the back
+                chat_id, queue = self._queues.popitem(last=False)
+                future, fn, args = queue.popleft()
+                if queue:
+                    self._queues[chat_id] = queue
+                self._pending -= 1
+                self._running += 1
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._running -= 1
@@ -0,0 +1,178 @@
+import copy
+import datetime
+import logging
+import threading
+import time
+import traceback
+
+
+class IndexNotReady(Exception):
+    pass
+
+
+class TaskIndex:
+    """
+    In-memory index of the work items in the current iteration, keyed by
+    owner, parent, state and the `Blocked` tag.
+
+    The index refreshes itself in the background, fetching only the work
+    items that were added or changed since the last refresh, so lookups never
+    wait for Azure Devops. Until the first refresh is done, lookups raise
+    `IndexNotReady`.
+    """
+
+    def __init__(self, get_ids, get_work_items, task_builder, refresh_interval):
+        self._get_ids = get_ids
+        self._get_work_items = get_work_items
+        self._task_builder = task_builder
+        self._refresh_interval = refresh_interval
+
+        # work items in the iteration, and their parents outside of it.
+        # stored tasks are never changed, lookups get copies of them
+        self._items = {}
+        self._outside = {}
+        self._types = {}
+        self._parents = {}
+        self._by_owner = {}
+        self._by_parent = {}
+        self._by_state = {}
+        self._blocked = set()
+
+        self._refreshed_at = None
+        self._ready = threading.Event()
+        self._lock = threading.RLock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logging.error(traceback.format_exc())
+
+            time.sleep(self._refresh_interval)
+
+    def _unlink(self, id):
+        task = self._items.pop(id)
+        self._by_owner.get(task.owner, set()).discard(id)
+        self._by_state.get(task.state, set()).discard(id)
+        self._by_parent.get(self._parents.pop(id, None), set()).discard(id)
+        self._blocked.discard(id)
+        self._types.pop(id, None)
+
+    def _link(self, work_item):
+        task = self._task_builder.from_work_item(work_item)
+        parent_id = work_item.fields.get("System.Parent")
+
+        self._items[task.id] = task
+        self._types[task.id] = work_item.fields.get("System.WorkItemType")
+        self._parents[task.id] = parent_id
+        self._by_owner.setdefault(task.owner, set()).add(task.id)
+        self._by_state.setdefault(task.state, set()).add(task.id)
+        self._by_parent.setdefault(parent_id, set()).add(task.id)
+        if task.blocked:
+            self._blocked.add(task.id)
+
+    def refresh(self):
+        # changes that happen while we fetch are picked up in the next refresh
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        ids = set(self._get_ids())
+
+        with self._lock:
+            known = set(self._items.keys())
+            refreshed_at = self._refreshed_at
+
+        if refreshed_at is None:
+            changed = ids
+        else:
+            changed = set(self._get_ids(changed_since=refreshed_at)) & ids
+            changed |= ids - known
+        work_items = self._get_work_items(list(changed))
+
+        with self._lock:
+            for id in (known - ids) | (changed & known):
+                self._unlink(id)
+            for work_item in work_items:
+                self._link(work_item)
+
+            outside_ids = {
+                parent_id
+                for parent_id in self._parents.values()
+                if parent_id and parent_id not in self._items
+            }
+
+        # parents outside of the iteration are only kept for their names.
+        # they are few, so they are all fetched again on every refresh and
+        # the ones no longer referenced are dropped
+        outside = self._get_work_items(list(outside_ids)) if outside_ids else []
+
+        with self._lock:
+            self._outside = {
+                work_item.id: self._task_builder.from_work_item(work_item)
+                for work_item in outside
+            }
+            self._refreshed_at = started_at
+
+        logging.info(
+            f"Task index refreshed, {len(changed)} changed work items "
+            f"out of {len(ids)}."
+        )
+        self._ready.set()
+
+    def _with_parent(self, id):
+        parent_id = self._parents.get(id)
+        task = copy.copy(self._items[id])
+        task.parent = self._items.get(parent_id) or self._outside.get(parent_id)
+
+        return task
+
+    def find_owner(self, name):
+        # exact match first, then a single partial match
+        with self._lock:
+            owners = [owner for owner in self._by_owner.keys() if owner]
+
+        name = name.lower()
+        for owner in owners:
+            if owner.lower() == name:
+                return owner
+
+        matches = [owner for owner in owners if name in owner.lower()]
+        return matches[0] if len(matches) == 1 else None
+
+    def get_owner_tasks(self, owner, exclude_states=("Done", "Removed")):
+        with self._lock:
+            return [
+                self._with_parent(id)
+                for id in sorted(self._by_owner.get(owner, ()))
+                if self._types.get(id) == "Task"
+                and self._items[id].state not in exclude_states
+            ]
+
+    def get_item(self, id):
+        with self._lock:
+            if id not in self._items:
+                return None, []
+
+            children = [
+                self._with_parent(child_id)
+                for child_id in sorted(self._by_parent.get(id, ()))
+            ]
+
+            return self._with_parent(id), children
+
+    def get_blocked(self, exclude_states=("Done", "Removed")):
+        with self._lock:
+            done = set()
+            for state in exclude_states:
+                done |= self._by_state.get(state, set())
+
+            return [self._with_parent(id) for id in sorted(self._blocked - done)]
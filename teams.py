@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+
+from devops_client import Client
+from environment import Environment
+
+# load env
+env = Environment()
+
+# keys every team in the teams file must set
+REQUIRED_TEAM_KEYS = ["sprint_items_query_id", "epic_items_query_id"]
+
+
+class Team:
+    def __init__(
+        self,
+        name,
+        project_id,
+        team_id,
+        sprint_items_query_id,
+        epic_items_query_id,
+        collaborators,
+        chat_ids=None,
+    ):
+        self.name = name
+        self.project_id = project_id
+        self.team_id = team_id
+        self.sprint_items_query_id = sprint_items_query_id
+        self.epic_items_query_id = epic_items_query_id
+        self.collaborators = collaborators
+        self.chat_ids = [str(chat_id) for chat_id in chat_ids or []]
+
+    def __str__(self):
+        return f"Team {self.name} ({self.project_id}\\{self.team_id})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def _load_collaborators(collaborators):
+    # collaborators can be set inline or point to a separate json file
+    if isinstance(collaborators, str):
+        with open(collaborators) as f:
+            return json.load(f)
+
+    return collaborators
+
+
+class TeamRegistry:
+    """
+    Maps chats (telegram chat ids or discord channel ids) to their teams.
+
+    Clients are created lazily, one per team, and all of them share the same
+    Azure Devops connection and work item cache.
+    """
+
+    def __init__(self, teams, default=None):
+        self._teams = teams
+        self._default = default
+        self._clients = {}
+        self._lock = threading.Lock()
+
+        # index teams by chat id for quick lookups
+        self._chat_teams = {}
+        for team in teams.values():
+            for chat_id in team.chat_ids:
+                self._chat_teams[chat_id] = team
+
+    @classmethod
+    def load(cls):
+        # without a teams file, fall back to a single team set by the env
+        if not os.path.exists(env.teams_file):
+            team = Team(
+                name=env.team_id,
+                project_id=env.project_id,
+                team_id=env.team_id,
+                sprint_items_query_id=env.sprint_items_query_id,
+                epic_items_query_id=env.epic_items_query_id,
+                collaborators=_load_collaborators(env.collaborators_file),
+            )
+            return cls({team.name: team}, default=team)
+
+        with open(env.teams_file) as f:
+            config = json.load(f)
+
+        teams = {}
+        default = None
+        for name, team_config in config.items():
+            missing = [key for key in REQUIRED_TEAM_KEYS if not team_config.get(key)]
+            if missing:
+                raise ValueError(
+                    f"Team {name} in {env.teams_file} is missing "
+                    f"{', '.join(missing)}."
+                )
+
+            team = Team(
+                name=name,
+                project_id=team_config.get("project_id", env.project_id),
+                team_id=team_config.get("team_id", name),
+                sprint_items_query_id=team_config["sprint_items_query_id"],
+                epic_items_query_id=team_config["epic_items_query_id"],
+                collaborators=_load_collaborators(
+                    team_config.get("collaborators", env.collaborators_file)
+                ),
+                chat_ids=team_config.get("chat_ids"),
+            )
+            teams[name] = team
+            if team_config.get("default", False):
+                default = team
+
+        return cls(teams, default=default)
+
+    @property
+    def teams(self):
+        return list(self._teams.values())
+
+    def has_chat(self, chat_id):
+        return str(chat_id) in self._chat_teams
+
+    def get_team(self, chat_id):
+        return self._chat_teams.get(str(chat_id), self._default)
+
+    def get_client(self, chat_id):
+        team = self.get_team(chat_id)
+        if team is None:
+            return None
+
+        return self.get_team_client(team.name)
+
+    def resolve(self, chat_id):
+        # whether the chat is mapped to a team, and the client that serves it
+        return self.has_chat(chat_id), self.get_client(chat_id)
+
+    def get_team_client(self, name):
+        team = self._teams.get(name)
+        if team is None:
+            return None
+
+        with self._lock:
+            if team.name not in self._clients:
+                self._clients[team.name] = Client(team)
+
+            return self._clients[team.name]
@@ -1,14 +1,19 @@
-import json
+import asyncio
 import logging
 import traceback
 
 import discord
 from discord.ext import commands
 
-from devops_client import Client
 from environment import Environment
-from message_builder import (build_error, build_header, build_scope,
-                             build_tasks, build_waiting)
+from fetcher import RemoteRegistry
+from message_builder import (build_blocked, build_busy, build_coalesced,
+                             build_error, build_header, build_item,
+                             build_queued, build_scope, build_stale,
+                             build_tasks, build_unavailable, build_user_tasks,
+                             build_waiting, build_warming)
+from scheduler import CommandScheduler
+from task_index import IndexNotReady
 
 # load env
 env = Environment()
@@ -16,16 +21,27 @@ env = Environment()
 # fetch bot token
 bot_token = env.discord_bot_token
 
-# set the collaborators and get the devops client
-collaborators = []
-try:
-    with open('collaborators.json') as f:
-        collaborators = json.load(f)
-except FileNotFoundError:
-    print("Collaborators file not found.")
-    exit(1)
+# set the teams and their collaborators, clients are created per team.
+# with a fetcher daemon, teams and fetching are left to it instead
+if env.fetcher_socket:
+    registry = RemoteRegistry(env.fetcher_socket)
+else:
+    # only bots that fetch by themselves load azure devops and its settings
+    from teams import TeamRegistry
 
-client = Client(collaborators)
+    try:
+        registry = TeamRegistry.load()
+    except FileNotFoundError as e:
+        print(f"Teams or collaborators file {e.filename} not found.")
+        exit(1)
+    except ValueError as e:
+        print(f"Invalid teams file: {e}")
+        exit(1)
+
+# fetches run in the scheduler threads instead of blocking the event loop
+scheduler = CommandScheduler(workers=env.scheduler_workers,
+                             max_queue=env.scheduler_max_queue,
+                             coalesce_window=env.coalesce_window)
 
 intents = discord.Intents.default()
 intents.members = True
@@ -33,25 +49,54 @@ intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 
+async def get_channel_client(ctx):
+    # get the client of the team this channel belongs to. with a fetcher the
+    # team is resolved over its socket, keep that off the event loop
+    try:
+        client = await asyncio.to_thread(registry.get_client, ctx.channel.id)
+    except OSError:
+        logging.error(traceback.format_exc())
+        await ctx.send(build_unavailable())
+        return None
+
+    if client is None:
+        logging.warning(f"Channel {ctx.channel.id} has no team.")
+
+    return client
+
+
 @bot.command(name='daily')
 async def daily(ctx):
+    client = await get_channel_client(ctx)
+    if client is None:
+        return
+
     # prepare heading
     header = build_header()
 
+    # schedule the fetch, repeated dailies share the one already scheduled
+    ticket = scheduler.submit(ctx.channel.id, "daily", fetch_daily, client)
+    if ticket.coalesced:
+        logging.info(f"Daily command coalesced at channel {ctx.channel.id}.")
+        await ctx.send(build_coalesced(ticket.finished))
+        return
+
+    if ticket.rejected:
+        logging.warning("Daily command rejected, scheduler queue is full.")
+        await ctx.send(header + build_busy())
+        return
+
     # send message to show api is working
-    waiting = build_waiting()
+    if ticket.position:
+        waiting = build_queued(ticket.position)
+    else:
+        waiting = build_waiting()
     msg = header + waiting
     msg_obj = await ctx.send(msg)
 
-    # fetch scope info for body
-    effort = {}
-    scope = {}
-    fetched_tasks = {}
+    # fetch scope info for body, late sections are left out or stale
     try:
-        logging.info("Fetching data from Azure Devops...")
-        effort = client.get_total_effort()
-        scope = client.get_current_scope()
-        fetched_tasks = client.get_tasks()
+        report = await asyncio.wrap_future(ticket.future)
     except Exception:
         tb = traceback.format_exc()
         logging.error(tb)
@@ -62,15 +107,76 @@ async def daily(ctx):
         return
 
     # send scope and effort info
-    scope_msg = build_scope(scope, effort)
-    msg = header + scope_msg
+    scope_msg = build_scope(report["scope"].value, report["effort"].value)
+    stale_msg = build_stale(report)
+    msg = header + scope_msg + stale_msg
     await msg_obj.edit(content=msg)
 
     # send tasks info
-    msg = build_tasks(fetched_tasks)
+    msg = build_tasks(report["tasks"].value)
+    await ctx.send(msg)
+
+
+def fetch_daily(client):
+    logging.info("Fetching data from Azure Devops...")
+    return client.get_report()
+
+
+async def send_lookup(ctx, lookup):
+    # lookups may go through the fetcher, keep the loop free
+    try:
+        msg = await asyncio.to_thread(lookup)
+    except IndexNotReady:
+        msg = build_warming()
+    except OSError:
+        logging.error(traceback.format_exc())
+        msg = build_unavailable()
+    except Exception:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        msg = build_error(tb)
+
     await ctx.send(msg)
 
 
+# lookups are answered from the task index, without going to azure devops
+@bot.command(name='tasks')
+async def tasks(ctx, *, name=None):
+    client = await get_channel_client(ctx)
+    if client is None:
+        return
+
+    if not name:
+        await ctx.send("Usage: !tasks <collaborator>")
+        return
+
+    await send_lookup(ctx,
+                      lambda: build_user_tasks(*client.get_user_tasks(name)))
+
+
+@bot.command(name='item')
+async def item(ctx, id=None):
+    client = await get_channel_client(ctx)
+    if client is None:
+        return
+
+    if id is None or not id.isdigit():
+        await ctx.send("Usage: !item <id>")
+        return
+
+    id = int(id)
+    await send_lookup(ctx, lambda: build_item(*client.get_item(id)))
+
+
+@bot.command(name='blocked')
+async def blocked(ctx):
+    client = await get_channel_client(ctx)
+    if client is None:
+        return
+
+    await send_lookup(ctx, lambda: build_blocked(client.get_blocked()))
+
+
 @bot.event
 async def on_ready():
     logging.info(f'{bot.user.name} has connected to Discord!')
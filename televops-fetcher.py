@@ -0,0 +1,25 @@
+import logging
+import sys
+
+from environment import Environment
+from fetcher import FetcherServer
+from teams import TeamRegistry
+
+# load env
+env = Environment()
+
+# set the teams and their collaborators, clients are created per team
+try:
+    registry = TeamRegistry.load()
+except FileNotFoundError as e:
+    logging.error(f"Teams or collaborators file {e.filename} not found.")
+    sys.exit(1)
+except ValueError as e:
+    logging.error(f"Invalid teams file: {e}")
+    sys.exit(1)
+
+# serve reports to the bots over a local unix socket
+socket_path = env.fetcher_socket or "televops.sock"
+server = FetcherServer(socket_path, registry)
+logging.info(f"Fetcher listening on {socket_path}.")
+server.serve_forever()
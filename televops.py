@@ -1,16 +1,21 @@
-import json
 import logging
 import re
 import sys
 import traceback
+from concurrent.futures import Future
 
 import telegram.ext
 from telegram.ext import CommandHandler, Updater
 
-from devops_client import Client
 from environment import Environment
-from message_builder import (build_error, build_header, build_scope,
-                             build_tasks, build_waiting)
+from fetcher import RemoteRegistry
+from message_builder import (build_blocked, build_busy, build_coalesced,
+                             build_error, build_header, build_item,
+                             build_queued, build_scope, build_stale,
+                             build_tasks, build_unavailable, build_user_tasks,
+                             build_waiting, build_warming)
+from scheduler import CommandScheduler
+from task_index import IndexNotReady
 
 # load env
 env = Environment()
@@ -20,16 +25,27 @@ logging.info("Starting bot...")
 updater = Updater(token=env.telegram_token, use_context=True)
 dispatcher = updater.dispatcher
 
-# set the collaborators and get the devops client
-collaborators = []
-try:
-    with open('collaborators.json') as f:
-        collaborators = json.load(f)
-except FileNotFoundError:
-    logging.error("Collaborators file not found.")
-    sys.exit(1)
+# set the teams and their collaborators, clients are created per team.
+# with a fetcher daemon, teams and fetching are left to it instead
+if env.fetcher_socket:
+    registry = RemoteRegistry(env.fetcher_socket)
+else:
+    # only bots that fetch by themselves load azure devops and its settings
+    from teams import TeamRegistry
 
-client = Client(collaborators)
+    try:
+        registry = TeamRegistry.load()
+    except FileNotFoundError as e:
+        logging.error(f"Teams or collaborators file {e.filename} not found.")
+        sys.exit(1)
+    except ValueError as e:
+        logging.error(f"Invalid teams file: {e}")
+        sys.exit(1)
+
+# commands are run by the scheduler instead of the dispatcher threads
+scheduler = CommandScheduler(workers=env.scheduler_workers,
+                             max_queue=env.scheduler_max_queue,
+                             coalesce_window=env.coalesce_window)
 
 
 def prepare_message(msg, hard_parse=False):
@@ -47,6 +63,11 @@ def prepare_message(msg, hard_parse=False):
                   .replace("!", "\!") # noqa
 
 
+def escape_code(msg):
+    # backslashes and backticks would break out of a monospace block
+    return msg.replace("\\", "\\\\").replace("`", "\\`")
+
+
 def validate_chat_id(chat_id):
     chat_id = str(chat_id)
     allowed_chat_ids = env.telegram_allowed_chat_ids
@@ -58,47 +79,131 @@ def validate_chat_id(chat_id):
         return True
 
 
-# set the function command callback for the daily
-def daily(update, context):
+def get_chat_client(update, context, command):
     chat_id = update.message.chat_id
-    logging.info("Daily command received from "
+    logging.info(f"{command} command received from "
                  f"@{update.effective_user['username']} "
                  f"at channel {chat_id}.")
 
-    # validate chat_id
-    if not validate_chat_id(chat_id):
+    # validate chat_id before going to the registry, chats mapped to a team
+    # in the teams file are always allowed though
+    allowed = validate_chat_id(chat_id)
+
+    # resolve the team this chat belongs to, possibly through the fetcher
+    try:
+        has_chat, client = registry.resolve(chat_id)
+    except OSError:
+        logging.error(traceback.format_exc())
+        if allowed:
+            context.bot.send_message(
+                chat_id=chat_id,
+                text=prepare_message(build_unavailable()),
+                parse_mode=telegram.ParseMode.MARKDOWN_V2)
+        return None
+
+    if not allowed and not has_chat:
         logging.warning(f"Chat ID {chat_id} is not allowed.")
+        return None
+
+    if client is None:
+        logging.warning(f"Chat ID {chat_id} has no team.")
+
+    return client
+
+
+def send_lookup(update, context, lookup):
+    try:
+        msg = prepare_message(lookup())
+    except IndexNotReady:
+        msg = prepare_message(build_warming())
+    except OSError:
+        logging.error(traceback.format_exc())
+        msg = prepare_message(build_unavailable())
+    except Exception:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        msg = prepare_message(build_error(tb), hard_parse=True)
+
+    context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=msg,
+        parse_mode=telegram.ParseMode.MARKDOWN_V2)
+
+
+def send_usage(update, context, usage):
+    msg = prepare_message(f"Usage: {usage}", hard_parse=True)
+    context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=msg,
+        parse_mode=telegram.ParseMode.MARKDOWN_V2)
+
+
+# set the function command callback for the daily
+def daily(update, context):
+    chat_id = update.message.chat_id
+    client = get_chat_client(update, context, "Daily")
+    if client is None:
         return
 
     # prepare heading
     header = build_header()
 
+    # schedule the daily, the job waits until the waiting message is sent
+    message_sent = Future()
+    ticket = scheduler.submit(chat_id, "daily", fetch_daily, context.bot,
+                              client, chat_id, header, message_sent)
+    if ticket.coalesced:
+        logging.info(f"Daily command coalesced at channel {chat_id}.")
+        msg = prepare_message(build_coalesced(ticket.finished))
+        context.bot.send_message(
+            chat_id=chat_id,
+            text=msg,
+            parse_mode=telegram.ParseMode.MARKDOWN_V2)
+        return
+
+    if ticket.rejected:
+        logging.warning("Daily command rejected, scheduler queue is full.")
+        msg = prepare_message(header + build_busy())
+        context.bot.send_message(
+            chat_id=chat_id,
+            text=msg,
+            parse_mode=telegram.ParseMode.MARKDOWN_V2)
+        return
+
     # send message to show api is working
-    waiting = build_waiting()
+    if ticket.position:
+        waiting = build_queued(ticket.position)
+    else:
+        waiting = build_waiting()
     msg = prepare_message(header + waiting)
-    message = context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=msg,
-        parse_mode=telegram.ParseMode.MARKDOWN_V2)
+    try:
+        message = context.bot.send_message(
+            chat_id=chat_id,
+            text=msg,
+            parse_mode=telegram.ParseMode.MARKDOWN_V2)
+    except Exception as e:
+        message_sent.set_exception(e)
+        raise
+    message_sent.set_result(message)
+
+
+def fetch_daily(bot, client, chat_id, header, message_sent):
+    message = message_sent.result()
 
-    # fetch scope info for body
-    effort = {}
-    scope = {}
-    fetched_tasks = {}
+    # fetch scope info for body, late sections are left out or stale
     try:
         logging.info("Fetching data from Azure Devops...")
-        effort = client.get_total_effort()
-        scope = client.get_current_scope()
-        fetched_tasks = client.get_tasks()
+        report = client.get_report()
 
         # prepare task and scope message
-        scope_msg = build_scope(scope, effort)
-        tasks_msg = build_tasks(fetched_tasks)
-        msg = prepare_message(header + scope_msg + tasks_msg)
+        scope_msg = build_scope(report["scope"].value, report["effort"].value)
+        stale_msg = build_stale(report, escape=escape_code)
+        tasks_msg = build_tasks(report["tasks"].value)
+        msg = prepare_message(header + scope_msg + stale_msg + tasks_msg)
 
         # edit message with daily contents
-        context.bot.edit_message_text(
-            chat_id=update.effective_chat.id,
+        bot.edit_message_text(
+            chat_id=chat_id,
             message_id=message["message_id"],
             text=msg,
             parse_mode=telegram.ParseMode.MARKDOWN_V2)
@@ -109,16 +214,57 @@ def daily(update, context):
         # prepare error message
         error = build_error(tb)
         msg = prepare_message(header + error, hard_parse=True)
-        context.bot.edit_message_text(
-            chat_id=update.effective_chat.id,
+        bot.edit_message_text(
+            chat_id=chat_id,
             message_id=message["message_id"],
             text=msg,
             parse_mode=telegram.ParseMode.MARKDOWN_V2)
+
+        # let the scheduler know, so retries are not coalesced into it
+        raise
+
+
+# lookups are answered from the task index, without going to azure devops
+def tasks(update, context):
+    client = get_chat_client(update, context, "Tasks")
+    if client is None:
+        return
+
+    if not context.args:
+        send_usage(update, context, "/tasks <collaborator>")
+        return
+
+    name = " ".join(context.args)
+    send_lookup(update, context,
+                lambda: build_user_tasks(*client.get_user_tasks(name)))
+
+
+def item(update, context):
+    client = get_chat_client(update, context, "Item")
+    if client is None:
+        return
+
+    if not context.args or not context.args[0].isdigit():
+        send_usage(update, context, "/item <id>")
+        return
+
+    id = int(context.args[0])
+    send_lookup(update, context, lambda: build_item(*client.get_item(id)))
+
+
+def blocked(update, context):
+    client = get_chat_client(update, context, "Blocked")
+    if client is None:
         return
 
+    send_lookup(update, context, lambda: build_blocked(client.get_blocked()))
+
 
 daily_handler = CommandHandler("daily", daily)
 dispatcher.add_handler(daily_handler)
+dispatcher.add_handler(CommandHandler("tasks", tasks))
+dispatcher.add_handler(CommandHandler("item", item))
+dispatcher.add_handler(CommandHandler("blocked", blocked))
 
 updater.start_polling()
 logging.info("Bot started and listening for commands.")
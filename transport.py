@@ -0,0 +1,209 @@
+import functools
+import http.client
+import threading
+
+import requests
+from msrest.universal_http.requests import (RequestHTTPSenderConfiguration,
+                                            RequestsHTTPSender)
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolManager
+
+# azure devops spreads its apis over a few hosts (resource areas), keep a
+# pool for each of them instead of evicting one for the other
+POOL_HOSTS = 10
+
+
+class TransportStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+
+    def record(self, bytes_decoded):
+        with self._lock:
+            self.requests += 1
+            self.bytes_decoded += bytes_decoded
+
+    def record_received(self, bytes_received):
+        with self._lock:
+            self.bytes_received += bytes_received
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "reused": max(self.requests - self.connections, 0),
+                "bytes_received": self.bytes_received,
+                "bytes_decoded": self.bytes_decoded,
+            }
+
+    def __str__(self):
+        stats = self.snapshot()
+        return (
+            f"{stats['requests']} requests, {stats['connections']} connections "
+            f"({stats['reused']} reused), {stats['bytes_received']} bytes "
+            f"received ({stats['bytes_decoded']} decoded)"
+        )
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class _CountingReader:
+    """
+    Socket file wrapper that counts every byte read from the connection,
+    whatever the response framing (content length, chunked or until close).
+    """
+
+    def __init__(self, fp, stats):
+        self._fp = fp
+        self._stats = stats
+
+    def read(self, *args):
+        data = self._fp.read(*args)
+        self._stats.record_received(len(data))
+        return data
+
+    def read1(self, *args):
+        data = self._fp.read1(*args)
+        self._stats.record_received(len(data))
+        return data
+
+    def readline(self, *args):
+        data = self._fp.readline(*args)
+        self._stats.record_received(len(data))
+        return data
+
+    def readinto(self, buffer):
+        size = self._fp.readinto(buffer)
+        self._stats.record_received(size or 0)
+        return size
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+
+class _CountingHTTPResponse(http.client.HTTPResponse):
+    def __init__(self, sock, *args, stats, **kwargs):
+        super().__init__(sock, *args, **kwargs)
+        self.fp = _CountingReader(self.fp, stats)
+
+
+class _CountingPoolManager(PoolManager):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context=request_context)
+
+        # count every connection the pool opens, even after it is evicted,
+        # and the bytes read from them (status line, headers and body)
+        new_conn = pool._new_conn
+
+        def _new_conn():
+            self._stats.record_connection()
+            conn = new_conn()
+            conn.response_class = functools.partial(
+                _CountingHTTPResponse, stats=self._stats
+            )
+            return conn
+
+        pool._new_conn = _new_conn
+
+        return pool
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+        self.poolmanager = _CountingPoolManager(
+            self._stats,
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            **pool_kwargs,
+        )
+
+
+class PooledHTTPSender(RequestsHTTPSender):
+    """
+    msrest sender that shares one pooled session between every thread,
+    instead of opening a new session (and connections) per thread.
+    """
+
+    def __init__(self, config, session, stats):
+        super().__init__(config)
+        self._shared_session = session
+        self._stats = stats
+
+    @property
+    def session(self):
+        return self._shared_session
+
+    @session.setter
+    def session(self, value):
+        self._shared_session = value
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+
+        # read the body right away so the connection goes back to the pool,
+        # the bytes that went over the wire are counted by the connection
+        self._stats.record(len(response.internal_response.content))
+
+        return response
+
+
+class Transport:
+    """
+    HTTP transport for the Azure Devops clients: a keep-alive connection pool
+    shared by every client and explicit timeouts. Responses are compressed
+    by default, `compression` only allows turning that off.
+    """
+
+    def __init__(self, pool_size, connect_timeout, read_timeout, compression=True):
+        self._timeout = (connect_timeout, read_timeout)
+        self._compression = compression
+        self.stats = TransportStats()
+
+        self._session = requests.Session()
+        for protocol in ("http://", "https://"):
+            adapter = _CountingHTTPAdapter(
+                self.stats, pool_connections=POOL_HOSTS, pool_maxsize=pool_size
+            )
+            self._session.mount(protocol, adapter)
+
+        # redirects and retries are set up once, the msrest default way
+        RequestsHTTPSender(RequestHTTPSenderConfiguration())._init_session(
+            self._session
+        )
+
+    def configure(self, client):
+        config = client.config
+        pipeline = config.pipeline
+        if isinstance(pipeline._sender.driver, PooledHTTPSender):
+            return
+
+        # keep connections open between requests
+        config.keep_alive = True
+        config.connection.timeout = self._timeout
+        if not self._compression:
+            # requests asks for gzip/deflate by default
+            config.headers["Accept-Encoding"] = "identity"
+
+        pipeline._sender.driver = PooledHTTPSender(config, self._session, self.stats)